@@ -1,16 +1,41 @@
 import os
-import gzip
+import sys
+import math
+import asyncio
+import aiohttp
 import requests
 import numpy as np
 import pandas as pd
+from io import StringIO
+from email.utils import formatdate, parsedate_to_datetime
 from datetime import timezone, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
-from astroquery.jplhorizons import Horizons
 from astropy.time import Time
-from astropy.coordinates import Angle
+from astropy.coordinates import EarthLocation, get_body_barycentric
 import astropy.units as u
-from astropy.time import TimeDelta
+from astropy.utils import iers
+
+# The shared horizon mask lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from horizon import horizon_alt_deg
+
+try:
+    from numba import njit, prange
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+try:
+    import diskcache
+    _DISKCACHE_AVAILABLE = True
+except ImportError:
+    _DISKCACHE_AVAILABLE = False
+
+# Load the IERS table once at import and accept it at any age, so astropy
+# never stalls on a lazy download in the middle of a sidereal_time call
+iers.conf.auto_max_age = None
+iers.IERS_Auto.open()
 
 
 ASTEROID_NAMES = {}
@@ -42,6 +67,11 @@ NIGHTS = {
 MAG_MIN = 16
 MAG_MAX = 19
 
+# Closest geocentric distance (AU) assumed when deciding whether a faint
+# (high H) object could ever reach MAG_MAX; objects passing closer than
+# this can be dropped, so keep it near lunar distance
+MIN_DISTANCE_AU = 0.002
+
 # Desired final count
 TARGET_COUNT = 6
 
@@ -51,22 +81,40 @@ BATCH_SIZE = 100
 # Number of concurrent API calls - best not to change this
 MAX_WORKERS = 10
 
-# Telescopius horizon mask (AZ°, ALT°)
-HORIZON_POINTS = np.array([
-    [172, 60], [186, 53], [249, 45], [271, 36], [290, 26],
-    [306, 31], [330, 43], [357, 50], [29, 41],  [53, 32],
-    [73, 32],  [101, 30], [119, 31], [130, 54], [129, 63]
-])
+# ============================================================
+# HTTP SESSIONS
+# ============================================================
+
+HORIZONS_URL = "https://ssd.jpl.nasa.gov/api/horizons.api"
+
+# Horizons CSV observer table for QUANTITIES 1,4,9 with ANG_FORMAT=DEG
+HORIZONS_COLUMNS = ["Date", "Solar", "Lunar", "RA", "DEC", "AZ", "EL", "V", "S_brt"]
+
+# Ephemeris fields kept per (asteroid, night)
+EPHEM_FIELDS = ["RA", "DEC", "V", "EL", "AZ"]
+
+# Keep-alive session for MPC downloads
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                       max_retries=3))
 
 # ============================================================
-# HORIZON FUNCTION
+# HORIZONS CACHE
 # ============================================================
 
-HORIZON_POINTS[:, 0] %= 360
-HORIZON_POINTS = HORIZON_POINTS[np.argsort(HORIZON_POINTS[:, 0])]
+# Ephemerides already fetched for this site and set of nights are reused
+# across runs; bump the version to invalidate every stored entry
+HORIZONS_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  ".horizons_cache")
+HORIZONS_CACHE_VERSION = 1
+
+def open_horizons_cache():
+    """Open the on-disk Horizons cache, or return None without diskcache."""
+    return diskcache.Cache(HORIZONS_CACHE_DIR) if _DISKCACHE_AVAILABLE else None
 
-def horizon_alt(az):
-    return np.interp(az, HORIZON_POINTS[:,0], HORIZON_POINTS[:,1], period=360)
+def horizons_cache_key(num):
+    return (HORIZONS_CACHE_VERSION, int(num), tuple(NIGHTS.values()),
+            LOCATION['lat'], LOCATION['lon'], LOCATION['elevation'])
 
 # ============================================================
 # MPCORB HANDLING
@@ -76,146 +124,467 @@ NEO_URL = "https://www.minorplanetcenter.net/iau/MPCORB/NEA.txt"
 NEO_FILE = "NEA.txt"
 
 def ensure_mpcorb():
+    headers = {'Accept-Encoding': 'gzip'}
+
+    # Conditional GET: the server answers 304 if our copy is still current
     if os.path.exists(NEO_FILE):
-        return
+        headers['If-Modified-Since'] = formatdate(os.path.getmtime(NEO_FILE), usegmt=True)
 
-    print("Downloading NEA.txt...")
-    r = requests.get(NEO_URL, stream=True)
-    with open("NEA.txt", "wb") as f:
-        f.write(r.content)
+    tmp_file = NEO_FILE + ".part"
+    try:
+        with _SESSION.get(NEO_URL, stream=True, headers=headers, timeout=60) as r:
+            if r.status_code == 304:
+                return
+            r.raise_for_status()
 
-    #with gzip.open("NEA.txt.gz", "rb") as f_in:
-    #    with open(NEO_FILE, "wb") as f_out:
-    #        f_out.write(f_in.read())
+            print("Downloading NEA.txt...")
 
-    #os.remove("MPCORB.tar.gz")
+            # Decompress on the fly and stream to disk in 1 MiB chunks;
+            # iter_content raises a dropped transfer as a RequestException
+            try:
+                with open(tmp_file, "wb") as f:
+                    for chunk in r.iter_content(1 << 20):
+                        f.write(chunk)
+                os.replace(tmp_file, NEO_FILE)
+            finally:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+
+            # Match the server timestamp so the next If-Modified-Since is exact
+            if 'Last-Modified' in r.headers:
+                mtime = parsedate_to_datetime(r.headers['Last-Modified']).timestamp()
+                os.utime(NEO_FILE, (mtime, mtime))
+
+    except requests.RequestException as e:
+        if not os.path.exists(NEO_FILE):
+            raise
+        print(f"Could not refresh NEA.txt ({e}), using existing copy")
 
 # ============================================================
 # Helper Functions
 # ============================================================
 
 def ra_to_hms(ra_deg):
-    a = Angle(ra_deg * u.deg)
-    return a.to_string(unit=u.hourangle, sep=' ', precision=2, pad=True)
+    """Format RA degrees (scalar or array) as 'HH MM SS.ss' strings."""
+    # Round once in units of 0.01 s so carries propagate into minutes/hours
+    cs = np.rint(np.atleast_1d(ra_deg) * (24 * 3600 * 100 / 360)).astype(np.int64)
+    h, cs = np.divmod(cs, 3600 * 100)
+    m, cs = np.divmod(cs, 60 * 100)
+    s, cs = np.divmod(cs, 100)
+    return [f"{hh:02d} {mm:02d} {ss:02d}.{cc:02d}" for hh, mm, ss, cc in zip(h, m, s, cs)]
 
 def dec_to_dms(dec_deg):
-    a = Angle(dec_deg * u.deg)
-    return a.to_string(unit=u.deg, sep=' ', precision=1, alwayssign=True, pad=True)
-
-def hour_angle_hours(ra_deg, time_utc):
-    lst = time_utc.sidereal_time(
-        'apparent',
-        longitude=LOCATION['lon'] * u.deg
-    )
-    ra = Angle(ra_deg * u.deg).to(u.hourangle)
-    ha = (lst - ra).wrap_at(12 * u.hourangle)
-    return abs(ha.hour)
-
-def compute_transit_time(ra_deg, date_utc):
+    """Format DEC degrees (scalar or array) as '±DD MM SS.s' strings."""
+    dec_deg = np.atleast_1d(dec_deg)
+    signs = np.where(np.signbit(dec_deg), '-', '+')
+    ds = np.rint(np.abs(dec_deg) * (3600 * 10)).astype(np.int64)
+    d, ds = np.divmod(ds, 3600 * 10)
+    m, ds = np.divmod(ds, 60 * 10)
+    s, ds = np.divmod(ds, 10)
+    return [f"{sg}{dd:02d} {mm:02d} {ss:02d}.{tt}" for sg, dd, mm, ss, tt in zip(signs, d, m, s, ds)]
+
+# Sidereal hours elapsed per solar hour
+SIDEREAL_RATE = 1.00273791
+
+# Transit search window: 10pm–2am local ≈ 10:30–14:30 UTC
+TRANSIT_WINDOW_START_UTC = 10.5   # hours
+TRANSIT_WINDOW_HOURS = 4
+
+# Apparent LST at the middle of each night's transit search window,
+# keyed by night: (window start JD, window middle JD, LST hours)
+LST_REFS = {}
+
+def build_lst_refs():
+    """Evaluate apparent sidereal time once per night at the window middle."""
+    for night, jd in NIGHTS.items():
+        # Built directly in JD from 0h UTC of the night's date (JD days start at noon)
+        t0_jd = np.floor(jd - 0.5) + 0.5 + TRANSIT_WINDOW_START_UTC / 24
+        mid_jd = t0_jd + TRANSIT_WINDOW_HOURS / 48
+
+        lst = Time(mid_jd, format='jd', scale='utc').sidereal_time(
+            'apparent',
+            longitude=LOCATION['lon'] * u.deg
+        ).hour
+
+        LST_REFS[night] = (t0_jd, mid_jd, lst)
+
+def hour_angle_hours(ra_deg, night, time_jd):
+    t0_jd, mid_jd, lst_mid = LST_REFS[night]
+    ra_h = ra_deg * (1 / 15.0)
+
+    # LST is linear in time to well under a second over a few hours
+    lst = lst_mid + SIDEREAL_RATE * (time_jd - mid_jd) * 24
+    ha = (lst - ra_h + 12) % 24 - 12
+    return np.abs(ha)
+
+def compute_transit_time(ra_deg, night):
     """
     Compute exact upper transit time near local night.
     Returns astropy Time (UTC).
     """
-    ra = Angle(ra_deg * u.deg).to(u.hourangle)
-
-    # Search window: 10pm–2am local ≈ 10:30–14:30 UTC
-    t0 = Time(date_utc.iso.split()[0] + " 10:30")
-    times = t0 + TimeDelta(np.linspace(0, 4, 241) * u.hour)
+    t0_jd, mid_jd, lst_mid = LST_REFS[night]
+    ra_h = ra_deg * (1 / 15.0)
 
-    lsts = times.sidereal_time(
-        'apparent',
-        longitude=LOCATION['lon'] * u.deg
-    )
+    # Closed form for LST == RA nearest the window middle; transits
+    # outside the window are clamped to its edges
+    dt_hours = ((ra_h - lst_mid + 12) % 24 - 12) / SIDEREAL_RATE
+    transit_jd = np.clip(mid_jd + dt_hours / 24, t0_jd, t0_jd + TRANSIT_WINDOW_HOURS / 24)
 
-    ha = (lsts - ra).wrap_at(12 * u.hourangle).hour
-    idx = np.argmin(np.abs(ha))
-
-    return times[idx]
+    return Time(transit_jd, format='jd')
 
 
 # ============================================================
 # STAGE 1: PARSE & PRE-FILTER
 # ============================================================
 
+# Orbital elements kept per candidate (MPCORB columns 1-103)
+ELEMENT_DTYPE = np.dtype([
+    ('num', 'i8'),
+    ('H', 'f8'),       # absolute magnitude
+    ('G', 'f8'),       # slope parameter
+    ('epoch', 'f8'),   # osculation epoch, JD (TT)
+    ('M', 'f8'),       # mean anomaly, deg
+    ('w', 'f8'),       # argument of perihelion, deg
+    ('Om', 'f8'),      # longitude of ascending node, deg
+    ('incl', 'f8'),    # inclination, deg
+    ('e', 'f8'),       # eccentricity
+    ('n', 'f8'),       # mean daily motion, deg/day
+    ('a', 'f8'),       # semi-major axis, AU
+])
+
+# Slope parameter assumed by the MPC when none is given
+DEFAULT_G = 0.15
+
+# Digits used by MPC packed dates (1-9, then A=10 ... V=31)
+_PACKED_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUV"
+
+def unpack_epoch(packed):
+    """Convert an MPC packed epoch (e.g. K2555) to a Julian date (TT)."""
+    year = {'I': 1800, 'J': 1900, 'K': 2000}[packed[0]] + int(packed[1:3])
+    month = _PACKED_DIGITS.index(packed[3])
+    day = _PACKED_DIGITS.index(packed[4])
+
+    # Gregorian calendar date at 0h to JD
+    a = (14 - month) // 12
+    y = year + 4800 - a
+    m = month + 12 * a - 3
+    jdn = day + (153 * m + 2) // 5 + 365 * y + y // 4 - y // 100 + y // 400 - 32045
+    return jdn - 0.5
+
+# Fixed-width MPCORB fields read from NEA.txt
+MPCORB_COLSPECS = [(0, 7), (8, 13), (14, 19), (20, 25), (26, 35), (37, 46),
+                   (48, 57), (59, 68), (70, 79), (80, 91), (92, 103), (166, 194)]
+MPCORB_NAMES = ['num', 'H', 'G', 'epoch', 'M', 'w', 'Om', 'incl', 'e', 'n', 'a', 'name']
+
+# Earth's perihelion and aphelion distances, AU
+EARTH_R_MIN = 0.983
+EARTH_R_MAX = 1.017
+
+def reachable_h_max(a, e):
+    """
+    Faintest absolute magnitude that could still reach MAG_MAX for orbits
+    with semi-major axis a and eccentricity e. Ignores the phase term and
+    floors delta at MIN_DISTANCE_AU, so the bound is loose only for objects
+    that never pass closer to Earth than that.
+    """
+    q = a * (1 - e)
+    Q = a * (1 + e)
+
+    def r_delta(r):
+        # Smallest geocentric distance possible at heliocentric distance r
+        delta = np.maximum.reduce([EARTH_R_MIN - r, r - EARTH_R_MAX,
+                                   np.full_like(r, MIN_DISTANCE_AU)])
+        return r * delta
+
+    # r * delta is piecewise concave/increasing in r, so its minimum over
+    # [q, Q] lies at an endpoint or at one of the breakpoints
+    breaks = [q, Q,
+              np.clip(EARTH_R_MIN - MIN_DISTANCE_AU, q, Q),
+              np.clip(EARTH_R_MAX + MIN_DISTANCE_AU, q, Q)]
+    min_r_delta = np.minimum.reduce([r_delta(r) for r in breaks])
+
+    return MAG_MAX - 5 * np.log10(min_r_delta)
+
 def load_candidate_numbers():
     print("Parsing MPCORB...")
-    candidates = []
 
-    with open(NEO_FILE) as f:
-        for line in f:
-            if line.startswith("#"):
-                continue
+    df = pd.read_fwf(NEO_FILE, colspecs=MPCORB_COLSPECS, names=MPCORB_NAMES,
+                     header=None, comment='#', dtype=str)
 
-            try:
-                num = int(line[0:7])
-                aM   = float(line[8:13])
-                #a   = float(line[92:103])   # semi-major axis
-                #e   = float(line[70:79])    # eccentricity
+    numeric = ['num', 'H', 'G', 'M', 'w', 'Om', 'incl', 'e', 'n', 'a']
+    df[numeric] = df[numeric].apply(pd.to_numeric, errors='coerce')
+    df['G'] = df['G'].fillna(DEFAULT_G)
+
+    # Only a handful of distinct epochs occur, so unpack each once
+    epochs = {}
+    for packed in df['epoch'].dropna().unique():
+        try:
+            epochs[packed] = unpack_epoch(packed)
+        except (KeyError, ValueError, IndexError):
+            epochs[packed] = np.nan
+    df['epoch'] = df['epoch'].map(epochs)
 
-                name = line[166:194].strip()
-                if not name:
-                    name = f"({num})"
-            except:
-                continue
+    # Numbered objects with a complete set of elements only (packed
+    # numbers above 99999 and provisional designations don't parse)
+    df = df[df[list(ELEMENT_DTYPE.names)].notna().all(axis=1)]
+    df = df.astype({'num': np.int64})
 
-            # Store name lookup
-            ASTEROID_NAMES[num] = name
-            candidates.append(num)
+    # Skip objects too faint to reach MAG_MAX even at their closest approach
+    df = df[df['H'] <= reachable_h_max(df['a'].to_numpy(), df['e'].to_numpy())]
+
+    df['name'] = df['name'].fillna("(" + df['num'].astype(str) + ")")
+
+    # Store name lookup
+    ASTEROID_NAMES.update(zip(df['num'].tolist(), df['name'].tolist()))
+
+    candidates = np.empty(len(df), dtype=ELEMENT_DTYPE)
+    for field in ELEMENT_DTYPE.names:
+        candidates[field] = df[field].to_numpy()
 
     print(f"Candidate MBAs after MAG filter: {len(candidates)}")
     return candidates
 
 
+# ============================================================
+# STAGE 2: LOCAL PROPAGATION PRE-SCREEN
+# ============================================================
+
+# Mean obliquity of the ecliptic at J2000 (MPCORB elements are J2000 ecliptic)
+OBLIQUITY_J2000 = np.radians(23.4392911)
+
+# Newton iterations for Kepler's equation
+KEPLER_ITERATIONS = 6
+
+# Slack allowed on the two-body estimate before a candidate is sent to Horizons
+SCREEN_MAG_MARGIN = 1.0    # magnitudes
+SCREEN_ALT_MARGIN = 5.0    # degrees
+
+def propagate_batch(elements, jd):
+    """
+    Two-body heliocentric positions of all candidates at one JD (TT).
+    Returns an (N, 3) array of J2000 equatorial coordinates in AU.
+    """
+    e = elements['e']
+    M = np.radians((elements['M'] + elements['n'] * (jd - elements['epoch'])) % 360)
+
+    # Solve Kepler's equation M = E - e sin(E) for every candidate at once
+    E = np.where(e > 0.8, np.pi, M)
+    for _ in range(KEPLER_ITERATIONS):
+        E -= (E - e * np.sin(E) - M) / (1 - e * np.cos(E))
+
+    # Position in the orbital plane
+    a = elements['a']
+    xp = a * (np.cos(E) - e)
+    yp = a * np.sqrt(1 - e * e) * np.sin(E)
+
+    # Rotate orbital plane -> heliocentric ecliptic
+    w = np.radians(elements['w'])
+    Om = np.radians(elements['Om'])
+    incl = np.radians(elements['incl'])
+    cw, sw = np.cos(w), np.sin(w)
+    cO, sO = np.cos(Om), np.sin(Om)
+    ci, si = np.cos(incl), np.sin(incl)
+
+    x = (cw * cO - sw * sO * ci) * xp + (-sw * cO - cw * sO * ci) * yp
+    y = (cw * sO + sw * cO * ci) * xp + (-sw * sO + cw * cO * ci) * yp
+    z = (sw * si) * xp + (cw * si) * yp
+
+    # Ecliptic -> equatorial
+    ce, se = np.cos(OBLIQUITY_J2000), np.sin(OBLIQUITY_J2000)
+    return np.column_stack((x, ce * y - se * z, se * y + ce * z))
+
+# Element fields in the order the compiled kernel takes them
+KERNEL_FIELDS = ('a', 'e', 'incl', 'Om', 'w', 'M', 'n', 'epoch', 'H', 'G')
+
+if _NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _observe_kernel(a, e, incl, Om, w, M0, n, epoch, H, G, jd_tt, observer, rot,
+                        out_ra, out_dec, out_alt, out_az, out_V):
+        """
+        Compiled per-candidate equivalent of propagate_batch plus the NumPy
+        path in observe_batch; any change to that maths must be made here too.
+        """
+        ce = math.cos(OBLIQUITY_J2000)
+        se = math.sin(OBLIQUITY_J2000)
+        R2 = observer[0]**2 + observer[1]**2 + observer[2]**2
+
+        for k in prange(a.shape[0]):
+            ek = e[k]
+            M = math.radians((M0[k] + n[k] * (jd_tt - epoch[k])) % 360)
+
+            # Kepler's equation by Newton iteration
+            E = math.pi if ek > 0.8 else M
+            for _ in range(KEPLER_ITERATIONS):
+                E -= (E - ek * math.sin(E) - M) / (1 - ek * math.cos(E))
+
+            xp = a[k] * (math.cos(E) - ek)
+            yp = a[k] * math.sqrt(1 - ek * ek) * math.sin(E)
+
+            # Orbital plane -> heliocentric ecliptic -> equatorial
+            cw, sw = math.cos(math.radians(w[k])), math.sin(math.radians(w[k]))
+            cO, sO = math.cos(math.radians(Om[k])), math.sin(math.radians(Om[k]))
+            ci, si = math.cos(math.radians(incl[k])), math.sin(math.radians(incl[k]))
+
+            x = (cw * cO - sw * sO * ci) * xp + (-sw * cO - cw * sO * ci) * yp
+            y = (cw * sO + sw * cO * ci) * xp + (-sw * sO + cw * cO * ci) * yp
+            z = (sw * si) * xp + (cw * si) * yp
+            y, z = ce * y - se * z, se * y + ce * z
+
+            # Topocentric vector
+            dx = x - observer[0]
+            dy = y - observer[1]
+            dz = z - observer[2]
+            r = math.sqrt(x * x + y * y + z * z)
+            delta = math.sqrt(dx * dx + dy * dy + dz * dz)
+
+            out_ra[k] = math.degrees(math.atan2(dy, dx)) % 360
+            out_dec[k] = math.degrees(math.asin(dz / delta))
+
+            east = (rot[0, 0] * dx + rot[0, 1] * dy + rot[0, 2] * dz) / delta
+            north = (rot[1, 0] * dx + rot[1, 1] * dy + rot[1, 2] * dz) / delta
+            up = (rot[2, 0] * dx + rot[2, 1] * dy + rot[2, 2] * dz) / delta
+            out_alt[k] = math.degrees(math.asin(min(max(up, -1.0), 1.0)))
+            out_az[k] = math.degrees(math.atan2(east, north)) % 360
+
+            # (H, G) phase function
+            cos_phase = (r * r + delta * delta - R2) / (2 * r * delta)
+            tan_half = math.tan(math.acos(min(max(cos_phase, -1.0), 1.0)) / 2)
+            phi1 = math.exp(-3.33 * tan_half**0.63)
+            phi2 = math.exp(-1.87 * tan_half**1.22)
+            out_V[k] = (H[k] + 5 * math.log10(r * delta)
+                        - 2.5 * math.log10((1 - G[k]) * phi1 + G[k] * phi2))
+
+def observe_batch(elements, jd):
+    """
+    Local estimate of RA/Dec, Alt/Az and V magnitude for all candidates
+    at one JD (UTC). Returns (ra, dec, alt, az, V) arrays in degrees/mag.
+    Uses the compiled kernel when numba is installed.
+    """
+    t = Time(jd, format='jd', scale='utc')
+
+    # Heliocentric observer position: Earth from the built-in ephemeris
+    # plus the site offset, both in ICRS-aligned axes
+    site = EarthLocation.from_geodetic(LOCATION['lon'] * u.deg,
+                                       LOCATION['lat'] * u.deg,
+                                       LOCATION['elevation'] * u.m)
+    observer = (get_body_barycentric('earth', t) - get_body_barycentric('sun', t)
+                + site.get_gcrs_posvel(t)[0]).xyz.to_value(u.au)
+
+    # Equatorial -> local (east, north, up) in a single rotation
+    lst = np.radians(t.sidereal_time('apparent', longitude=LOCATION['lon'] * u.deg).degree)
+    lat = np.radians(LOCATION['lat'])
+    rot = np.array([
+        [-np.sin(lst),                np.cos(lst),                0.0],
+        [-np.sin(lat) * np.cos(lst), -np.sin(lat) * np.sin(lst), np.cos(lat)],
+        [ np.cos(lat) * np.cos(lst),  np.cos(lat) * np.sin(lst), np.sin(lat)],
+    ])
+
+    if _NUMBA_AVAILABLE:
+        out = np.empty((5, len(elements)))
+        columns = [np.ascontiguousarray(elements[f]) for f in KERNEL_FIELDS]
+        _observe_kernel(*columns, t.tt.jd, observer, rot, *out)
+        return tuple(out)
+
+    helio = propagate_batch(elements, t.tt.jd)
+    topo = helio - observer
+    r = np.linalg.norm(helio, axis=1)
+    delta = np.linalg.norm(topo, axis=1)
+
+    ra = np.degrees(np.arctan2(topo[:, 1], topo[:, 0])) % 360
+    dec = np.degrees(np.arcsin(topo[:, 2] / delta))
+
+    enu = (topo @ rot.T) / delta[:, None]
+    alt = np.degrees(np.arcsin(enu[:, 2]))
+    az = np.degrees(np.arctan2(enu[:, 0], enu[:, 1])) % 360
+
+    # Apparent magnitude from the (H, G) phase function
+    R = np.linalg.norm(observer)
+    phase = np.arccos(np.clip((r**2 + delta**2 - R**2) / (2 * r * delta), -1, 1))
+    tan_half = np.tan(phase / 2)
+    phi1 = np.exp(-3.33 * tan_half**0.63)
+    phi2 = np.exp(-1.87 * tan_half**1.22)
+    G = elements['G']
+    V = elements['H'] + 5 * np.log10(r * delta) - 2.5 * np.log10((1 - G) * phi1 + G * phi2)
+
+    return ra, dec, alt, az, V
+
+def screen_candidates(candidates):
+    """
+    Drop candidates whose local two-body estimate is clearly outside the
+    magnitude window or below the horizon mask on any night.
+    """
+    keep = np.ones(len(candidates), dtype=bool)
+
+    for jd in NIGHTS.values():
+        ra, dec, alt, az, V = observe_batch(candidates, jd)
+        keep &= (V >= MAG_MIN - SCREEN_MAG_MARGIN) & (V <= MAG_MAX + SCREEN_MAG_MARGIN)
+        keep &= alt >= horizon_alt_deg(az) - SCREEN_ALT_MARGIN
+
+    print(f"Candidates after local propagation screen: {keep.sum()}")
+    return candidates[keep]
+
+
 # ============================================================
 # STAGE 3.1: QUERY SINGLE ASTEROID
 # ============================================================
 
-def query_single_asteroid(num):
-    """Query a single asteroid and check if it passes constraints."""
-    
-    epochs = list(NIGHTS.values())
-    
-    try:
-        obj = Horizons(id=num, location=LOCATION, epochs=epochs)
-        eph = obj.ephemerides()
-        
-        nightly = {}
-        passes = True
-        
-        for i, night in enumerate(NIGHTS.keys()):
-            mag = eph['V'][i]
-            alt = eph['EL'][i]
-            az  = eph['AZ'][i]
-            ra  = eph['RA'][i]
-            
-            # Check constraints
-            if not (MAG_MIN <= mag <= MAG_MAX):
-                passes = False
-                break
-            
-            # Check asteroid is visible above horizon at observation time
-            if alt < horizon_alt(az):
-                passes = False
-                break
-            
-            transit = compute_transit_time(ra, Time(NIGHTS[night], format='jd'))
-            
-            nightly[night] = {
-                "RA_J2000": ra,
-                "DEC_J2000": eph['DEC'][i],
-                "Vmag": mag,
-                "Alt": alt,
-                "Az": az,
-                "Transit_UTC": transit
-            }
-        
-        if passes:
-            return (num, nightly)
-        else:
-            return None
-            
-    except Exception as e:
+async def query_single_asteroid(session, semaphore, num):
+    """
+    Fetch the ephemeris of a single asteroid at every night epoch.
+    Returns an (n_nights, len(EPHEM_FIELDS)) array, or None if Horizons
+    returned no usable ephemeris. Timeouts and HTTP errors are raised.
+    """
+    params = {
+        'format': 'json',
+        'COMMAND': f"'{num};'",
+        'OBJ_DATA': 'NO',
+        'MAKE_EPHEM': 'YES',
+        'EPHEM_TYPE': 'OBSERVER',
+        'CENTER': "'coord@399'",
+        'COORD_TYPE': 'GEODETIC',
+        # Horizons expects the site elevation in km
+        'SITE_COORD': f"'{LOCATION['lon']},{LOCATION['lat']},{LOCATION['elevation'] / 1000}'",
+        'TLIST': ' '.join(f"'{jd}'" for jd in NIGHTS.values()),
+        'QUANTITIES': "'1,4,9'",
+        'ANG_FORMAT': 'DEG',
+        'CSV_FORMAT': 'YES',
+    }
+
+    # The request's timeout only starts once it holds one of the slots,
+    # so queries queued behind the others are not cut off
+    async with semaphore:
+        async with session.get(HORIZONS_URL, params=params) as r:
+            r.raise_for_status()
+            data = await r.json(content_type=None)
+
+    # Ephemeris rows sit between the $$SOE / $$EOE markers
+    text = data.get("result", "")
+    if "$$SOE" not in text:
         return None
+    table = text.split("$$SOE", 1)[1].split("$$EOE", 1)[0]
+
+    eph = pd.read_csv(StringIO(table), header=None, skipinitialspace=True)
+    eph = eph.iloc[:, :len(HORIZONS_COLUMNS)]
+    eph.columns = HORIZONS_COLUMNS
+    if len(eph) != len(NIGHTS):
+        return None
+
+    return eph[EPHEM_FIELDS].apply(pd.to_numeric, errors='coerce').to_numpy()
+
+
+async def query_asteroids(asteroid_numbers):
+    """Run all queries of a batch concurrently over one pooled client session."""
+    # At most MAX_WORKERS queries are in flight; the connector keeps their
+    # connections alive, so the TCP+TLS handshake is reused across the batch
+    semaphore = asyncio.Semaphore(MAX_WORKERS)
+    connector = aiohttp.TCPConnector(limit=MAX_WORKERS, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        return await asyncio.gather(
+            *(query_single_asteroid(session, semaphore, num) for num in asteroid_numbers),
+            return_exceptions=True
+        )
 
 
 # ============================================================
@@ -223,26 +592,65 @@ def query_single_asteroid(num):
 # ============================================================
 
 def batch_query_horizons(asteroid_numbers):
-    """Query multiple asteroids in parallel."""
+    """
+    Query multiple asteroids in parallel and filter the batch at once.
+    Returns a DataFrame with one row per (passing asteroid, night).
+    """
 
-    results = {}
-    
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_asteroid = {executor.submit(query_single_asteroid, num): num 
-                              for num in asteroid_numbers}
-        
-        for future in as_completed(future_to_asteroid):
-            num = future_to_asteroid[future]
-            try:
-                result = future.result()
-                if result:
-                    asteroid_num, nightly = result
-                    results[asteroid_num] = nightly
-                    print(f"{asteroid_num} passes")
-            except Exception as e:
-                print(f"✗ {num} failed: {e}")
-    
-    return results
+    nights = list(NIGHTS.keys())
+    nums = np.asarray(asteroid_numbers, dtype=np.int64)
+
+    # One (asteroid, night) array per field; failed queries stay NaN and never pass
+    ra, dec, V, alt, az = (np.full((len(nums), len(nights)), np.nan)
+                           for _ in EPHEM_FIELDS)
+
+    # Fill from the on-disk cache first and only query the misses
+    cache = open_horizons_cache()
+    try:
+        keys = [horizons_cache_key(num) for num in nums]
+        misses = []
+        for i, key in enumerate(keys):
+            eph = cache.get(key) if cache is not None else None
+            if eph is None:
+                misses.append(i)
+            else:
+                ra[i], dec[i], V[i], alt[i], az[i] = eph.T
+
+        if misses:
+            fetched = asyncio.run(query_asteroids(nums[misses].tolist()))
+
+            for i, eph in zip(misses, fetched):
+                if isinstance(eph, Exception):
+                    print(f"✗ {nums[i]} failed: {type(eph).__name__} {eph}")
+                elif eph is not None:
+                    ra[i], dec[i], V[i], alt[i], az[i] = eph.T
+                    if cache is not None:
+                        cache[keys[i]] = eph
+    finally:
+        if cache is not None:
+            cache.close()
+
+    # Magnitude window and horizon mask for the whole batch in one pass;
+    # an asteroid passes only if it meets the constraints on every night
+    ok = (V >= MAG_MIN) & (V <= MAG_MAX) & (alt >= horizon_alt_deg(az))
+    passes = ok.all(axis=1)
+
+    for num in nums[passes]:
+        print(f"{num} passes")
+
+    transit = np.column_stack([compute_transit_time(ra[passes, j], night).jd
+                               for j, night in enumerate(nights)])
+
+    return pd.DataFrame({
+        "num": np.repeat(nums[passes], len(nights)),
+        "night": np.tile(nights, passes.sum()),
+        "RA": ra[passes].ravel(),
+        "DEC": dec[passes].ravel(),
+        "V": V[passes].ravel(),
+        "Alt": alt[passes].ravel(),
+        "Az": az[passes].ravel(),
+        "Transit_JD": transit.ravel(),
+    })
 
 
 # ============================================================
@@ -252,10 +660,17 @@ def batch_query_horizons(asteroid_numbers):
 def main():
     ensure_mpcorb()
     candidates = load_candidate_numbers()
+    candidates = screen_candidates(candidates)['num'].tolist()
+    build_lst_refs()
 
     print(f"Candidates is {len(candidates)}")
+    if not candidates:
+        print("No candidates left to query.")
+        return
     
-    all_results = {}
+    all_results = []
+    found = 0
+    batch_end = 0
     
     # Process candidates in batches until we have enough
     for batch_start in range(0, len(candidates), BATCH_SIZE):
@@ -265,39 +680,37 @@ def main():
         print(f"\nSearching asteroids {batch[0]} to {batch[-1]}...")
         
         batch_results = batch_query_horizons(batch)
-        all_results.update(batch_results)
+        all_results.append(batch_results)
+        found += batch_results["num"].nunique()
         
-        print(f"Found {len(all_results)} passing asteroids so far")
+        print(f"Found {found} passing asteroids so far")
         
         # Stop if we have enough
-        if len(all_results) >= TARGET_COUNT:
+        if found >= TARGET_COUNT:
             print(f"Reached target count of {TARGET_COUNT}")
             break
     
-    if len(all_results) < TARGET_COUNT:
-        print(f"\nOnly found {len(all_results)} objects after checking {batch_end} candidates.")
+    if found < TARGET_COUNT:
+        print(f"\nOnly found {found} objects after checking {batch_end} candidates.")
         print("Consider adjusting magnitude/H limits or increasing search range.")
     
-    # Take top N results
-    final_results = list(all_results.items())[:TARGET_COUNT]
+    # Take top N results (every passing asteroid has one row per night)
+    results = pd.concat(all_results, ignore_index=True).head(TARGET_COUNT * len(NIGHTS))
+    transit_local = Time(results["Transit_JD"].to_numpy(), format='jd').to_datetime(timezone=TZ)
     
     # Format output
-    rows = []
-    for num, data in final_results:
-        for night, info in data.items():
-            rows.append({
-                "Asteroid_Number": num,
-                "Asteroid_Name": ASTEROID_NAMES.get(num, ""),
-                "Date": night,
-                "RA": ra_to_hms(info["RA_J2000"]),
-                "DEC": dec_to_dms(info["DEC_J2000"]),
-                "Vmag": round(info["Vmag"], 2),
-                "Alt": round(info["Alt"], 1),
-                "Az": round(info["Az"], 1),
-                "Transit_Local": info["Transit_UTC"].to_datetime(timezone=TZ).strftime("%H:%M")
-            })
-    
-    df = pd.DataFrame(rows)
+    df = pd.DataFrame({
+        "Asteroid_Number": results["num"],
+        "Asteroid_Name": results["num"].map(ASTEROID_NAMES).fillna(""),
+        "Date": results["night"],
+        "RA": ra_to_hms(results["RA"].to_numpy()),
+        "DEC": dec_to_dms(results["DEC"].to_numpy()),
+        "Vmag": results["V"].round(2),
+        "Alt": results["Alt"].round(1),
+        "Az": results["Az"].round(1),
+        "Transit_Local": [t.strftime("%H:%M") for t in transit_local],
+    })
+
     print("\n" + "="*80)
     print("FINAL OBSERVING LIST")
     print("="*80)
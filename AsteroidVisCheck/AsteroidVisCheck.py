@@ -5,6 +5,7 @@ Usage: python asteroid_position.py <asteroid_id>
 Example: python asteroid_position.py 1 Ceres
 """
 
+import os
 import sys
 import numpy as np
 from datetime import timezone, timedelta
@@ -12,6 +13,16 @@ from astroquery.jplhorizons import Horizons
 from astropy.time import Time, TimeDelta
 from astropy.coordinates import Angle
 import astropy.units as u
+from astropy.utils import iers
+
+# The shared horizon mask lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from horizon import horizon_alt_deg
+
+# Load the IERS table once at import and accept it at any age, so astropy
+# never stalls on a lazy download in the middle of a sidereal_time call
+iers.conf.auto_max_age = None
+iers.IERS_Auto.open()
 
 # ============================================================
 # OBSERVER CONFIGURATION
@@ -24,13 +35,6 @@ LOCATION = {
     'utc_offset': 10.5      # hours (e.g. 10.5 for ACDT, -5 for EST, 0 for UTC)
 }
 
-# Telescopius horizon mask (AZ°, ALT°)
-HORIZON_POINTS = np.array([
-    [172, 60], [186, 53], [249, 45], [271, 36], [290, 26],
-    [306, 31], [330, 43], [357, 50], [29, 41],  [53, 32],
-    [73, 32],  [101, 30], [119, 31], [130, 54], [129, 63]
-])
-
 # ============================================================
 # DERIVED CONFIGURATION (DO NOT EDIT)
 # ============================================================
@@ -38,18 +42,6 @@ HORIZON_POINTS = np.array([
 # Timezone based on UTC offset
 TZ = timezone(timedelta(hours=LOCATION['utc_offset']))
 
-# ============================================================
-# HORIZON MASK
-# ============================================================
-
-# Sort and prepare horizon
-HORIZON_POINTS[:, 0] %= 360
-HORIZON_POINTS = HORIZON_POINTS[np.argsort(HORIZON_POINTS[:, 0])]
-
-def horizon_alt(az):
-    """Get minimum altitude at given azimuth based on horizon mask."""
-    return np.interp(az, HORIZON_POINTS[:,0], HORIZON_POINTS[:,1], period=360)
-
 # ============================================================
 # COORDINATE FORMATTING
 # ============================================================
@@ -105,7 +97,8 @@ def compute_transit_time(ra_deg, date):
 def find_viewable_window(asteroid_id, date):
     """
     Find the time window when asteroid is above horizon.
-    Returns (rise_time, set_time, transit_time) or None if never visible.
+    Returns (rise_time, set_time, transit_time, eph) or None if never visible,
+    where eph is the 10-minute ephemeris table the window was found from.
     """
     base_time = Time(date.iso.split()[0] + " 00:00")
     end_time = base_time + TimeDelta(24 * u.hour)
@@ -124,14 +117,11 @@ def find_viewable_window(asteroid_id, date):
     times = Time(eph['datetime_jd'], format='jd')
     
     # Check which times are above horizon
-    visible = []
-    for i in range(len(eph)):
-        alt = eph['EL'][i]
-        az = eph['AZ'][i]
-        if alt > horizon_alt(az):
-            visible.append(i)
+    alt = np.asarray(eph['EL'])
+    az = np.asarray(eph['AZ'])
+    visible = np.flatnonzero(alt > horizon_alt_deg(az))
     
-    if not visible:
+    if len(visible) == 0:
         return None
     
     # Find rise and set times
@@ -146,7 +136,24 @@ def find_viewable_window(asteroid_id, date):
     ra = eph['RA'][mid_idx]
     transit_time = compute_transit_time(ra, date)
     
-    return (rise_time, set_time, transit_time)
+    return (rise_time, set_time, transit_time, eph)
+
+def interpolate_ephemeris(eph, jd):
+    """
+    Interpolate RA, DEC, altitude and azimuth from an ephemeris table.
+    Returns (ra, dec, alt, az) in degrees, or None if jd is outside the table.
+    """
+    jds = np.asarray(eph['datetime_jd'])
+    if not jds[0] <= jd <= jds[-1]:
+        return None
+    
+    # Unwrap the angles that cross 360° so interpolation doesn't jump
+    ra = np.interp(jd, jds, np.unwrap(np.asarray(eph['RA']), period=360)) % 360
+    dec = np.interp(jd, jds, np.asarray(eph['DEC']))
+    alt = np.interp(jd, jds, np.asarray(eph['EL']))
+    az = np.interp(jd, jds, np.unwrap(np.asarray(eph['AZ']), period=360)) % 360
+    
+    return ra, dec, alt, az
 
 # ============================================================
 # MAIN CALCULATION
@@ -183,7 +190,7 @@ def calculate_asteroid_position(asteroid_id):
     az = eph['AZ'][0]
     
     # Current visibility
-    min_alt = horizon_alt(az)
+    min_alt = horizon_alt_deg(az)
     is_visible = alt > min_alt
     
     print("CURRENT POSITION:")
@@ -204,7 +211,7 @@ def calculate_asteroid_position(asteroid_id):
     window = find_viewable_window(asteroid_id, now)
     
     if window:
-        rise_time, set_time, transit_time = window
+        rise_time, set_time, transit_time, window_eph = window
         
         rise_local = rise_time.to_datetime(timezone=TZ)
         set_local = set_time.to_datetime(timezone=TZ)
@@ -217,13 +224,15 @@ def calculate_asteroid_position(asteroid_id):
         print(f"  Sets:        {set_local.strftime('%H:%M %Z')}")
         print(f"  Duration:    {duration:.1f} hours")
         
-        # Get position at transit
-        obj_transit = Horizons(id=asteroid_id, location=LOCATION, epochs=transit_time.jd)
-        eph_transit = obj_transit.ephemerides()
-        transit_ra = eph_transit['RA'][0]
-        transit_dec = eph_transit['DEC'][0]
-        transit_alt = eph_transit['EL'][0]
-        transit_az = eph_transit['AZ'][0]
+        # Get position at transit from tonight's ephemeris, only querying
+        # Horizons again if the transit falls outside the queried day
+        transit_pos = interpolate_ephemeris(window_eph, transit_time.jd)
+        if transit_pos is None:
+            obj_transit = Horizons(id=asteroid_id, location=LOCATION, epochs=transit_time.jd)
+            eph_transit = obj_transit.ephemerides()
+            transit_pos = (eph_transit['RA'][0], eph_transit['DEC'][0],
+                           eph_transit['EL'][0], eph_transit['AZ'][0])
+        transit_ra, transit_dec, transit_alt, transit_az = transit_pos
         
         print(f"\n  At transit:")
         print(f"    RA (J2000):  {ra_to_hms(transit_ra)}")
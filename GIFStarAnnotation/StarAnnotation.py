@@ -4,10 +4,11 @@ Annotates a GIF animation with a circle around a specified star using 2MASS coor
 """
 
 import argparse
+import re
 import sys
 from pathlib import Path
 import numpy as np
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageSequence
 from astropy.io import fits
 from astropy.wcs import WCS
 from astropy.coordinates import SkyCoord
@@ -19,6 +20,10 @@ import warnings
 warnings.filterwarnings('ignore')
 
 
+# J + RA (HHMMSSss) + Dec sign + Dec (DDMMSS plus optional fraction digits)
+TWOMASS_ID_RE = re.compile(r'J(\d{2})(\d{2})(\d{2})(\d{2})([+-])(\d{2})(\d{2})(\d{2})(\d*)')
+
+
 def parse_2mass_id(twomass_id):
     """Parse 2MASS identifier to extract RA and Dec.
     
@@ -28,24 +33,15 @@ def parse_2mass_id(twomass_id):
     if not twomass_id.startswith('J'):
         raise ValueError("2MASS ID must start with 'J'")
     
-    coords = twomass_id[1:]
-    
-    # RA: first 8 characters (HHMMSS.s or HHMMSSs)
-    ra_str = coords[:8]
-    hh = int(ra_str[:2])
-    mm = int(ra_str[2:4])
-    ss = float(ra_str[4:6] + '.' + ra_str[6:8])
+    match = TWOMASS_ID_RE.fullmatch(twomass_id)
+    if match is None:
+        raise ValueError(f"Invalid 2MASS ID: {twomass_id}")
     
-    # Dec: remaining characters
-    dec_str = coords[8:]
-    sign = 1 if dec_str[0] == '+' else -1
-    dec_str = dec_str[1:]
-    dd = int(dec_str[:2])
-    dm = int(dec_str[2:4])
-    ds = float(dec_str[4:6] + '.' + dec_str[6:]) if len(dec_str) > 6 else float(dec_str[4:6])
+    hh, mm, ss, ss_frac, sign, dd, dm, ds, ds_frac = match.groups()
+    sign = 1 if sign == '+' else -1
     
-    ra_deg = (hh + mm/60 + ss/3600) * 15  # Convert hours to degrees
-    dec_deg = sign * (dd + dm/60 + ds/3600)
+    ra_deg = (int(hh) + int(mm)/60 + float(f"{ss}.{ss_frac}")/3600) * 15  # Convert hours to degrees
+    dec_deg = sign * (int(dd) + int(dm)/60 + float(f"{ds}.{ds_frac or 0}")/3600)
     
     return ra_deg, dec_deg
 
@@ -101,21 +97,35 @@ def sky_to_pixel(wcs, ra, dec):
     return float(x), float(y)
 
 
-def draw_circle_on_frame(frame, x, y, radius, thickness, color=None):
-    """Draw circle on PIL Image frame."""
-    img = frame.convert('RGB') if frame.mode != 'RGB' else frame.copy()
-    draw = ImageDraw.Draw(img)
-    
+def draw_circle_on_frame(draw, x, y, radius, thickness, color=None):
+    """Draw circle in place through an ImageDraw bound to the frame canvas."""
     # Use white or red depending on image
     if color is None:
         color = (255, 0, 0)  # Red
     
-    # Draw circle with thickness
-    for i in range(thickness):
-        r = radius + i - thickness // 2
-        draw.ellipse([x-r, y-r, x+r, y+r], outline=color, width=1)
+    # Ring centred on radius; PIL draws the width inward from the bounding box
+    r = radius + thickness - 1 - thickness // 2
+    draw.ellipse([x-r, y-r, x+r, y+r], outline=color, width=thickness)
+
+
+def annotate_frames(img, x, y, radius, thickness):
+    """Yield every frame of a GIF with the circle drawn on it.
     
-    return img
+    The same RGB canvas is yielded each time, so the consumer must copy or
+    encode a frame before asking for the next one (PIL's GIF writer does).
+    """
+    # One RGB canvas and drawing context reused for every frame
+    canvas = Image.new('RGB', img.size)
+    draw = ImageDraw.Draw(canvas)
+    
+    for frame in ImageSequence.Iterator(img):
+        # Draw circle on frame (paste converts the frame to RGB)
+        canvas.paste(frame)
+        draw_circle_on_frame(draw, x, y, radius, thickness)
+        
+        # The GIF writer takes each frame's duration from its info
+        canvas.info['duration'] = frame.info.get('duration', 100)
+        yield canvas
 
 
 def process_gif(input_path, output_path, twomass_id, radius=20, thickness=2, 
@@ -151,35 +161,23 @@ def process_gif(input_path, output_path, twomass_id, radius=20, thickness=2,
     # Process all frames
     print("Drawing circles on all frames...")
     img = Image.open(input_path)
-    frames = []
-    durations = []
-    
-    try:
-        while True:
-            # Get frame duration
-            duration = img.info.get('duration', 100)
-            durations.append(duration)
-            
-            # Draw circle on frame
-            frame_with_circle = draw_circle_on_frame(img, x, y, radius, thickness)
-            frames.append(frame_with_circle)
-            
-            img.seek(img.tell() + 1)
-    except EOFError:
-        pass
+    loop = img.info.get('loop', 0)
     
-    print(f"Processed {len(frames)} frames")
+    # Frames are drawn lazily as the GIF encoder pulls them, so the
+    # annotated RGB frames are never all held in memory together
+    frames = annotate_frames(img, x, y, radius, thickness)
     
     # Save output GIF
     print(f"Saving to: {output_path}")
-    frames[0].save(
+    first_annotated = next(frames)
+    first_annotated.save(
         output_path,
         save_all=True,
-        append_images=frames[1:],
-        duration=durations,
-        loop=img.info.get('loop', 0)
+        append_images=frames,
+        loop=loop
     )
     
+    print(f"Processed {img.n_frames} frames")
     print("Done!")
     return True
 
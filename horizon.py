@@ -0,0 +1,39 @@
+"""
+Shared horizon mask for the asteroid tools.
+
+Both AsteroidObservationPlanner and AsteroidVisCheck read the mask from here,
+so HORIZON_POINTS only needs to be edited in one place.
+"""
+
+import numpy as np
+
+# ============================================================
+# OBSERVER CONFIGURATION
+# ============================================================
+
+# Telescopius horizon mask (AZ°, ALT°)
+HORIZON_POINTS = np.array([
+    [172, 60], [186, 53], [249, 45], [271, 36], [290, 26],
+    [306, 31], [330, 43], [357, 50], [29, 41],  [53, 32],
+    [73, 32],  [101, 30], [119, 31], [130, 54], [129, 63]
+])
+
+# ============================================================
+# HORIZON MASK
+# ============================================================
+
+# Sort and prepare horizon
+HORIZON_POINTS[:, 0] %= 360
+HORIZON_POINTS = HORIZON_POINTS[np.argsort(HORIZON_POINTS[:, 0])]
+
+# Horizon altitude sampled at every whole degree of azimuth (0..360 inclusive),
+# so a lookup is a gather plus a lerp instead of a binary search per call
+HORIZON_LUT = np.interp(np.arange(361), HORIZON_POINTS[:,0], HORIZON_POINTS[:,1], period=360)
+
+def horizon_alt_deg(az):
+    """Get minimum altitude at given azimuth(s) based on horizon mask."""
+    az = np.mod(np.asarray(az, dtype=np.float64), 360)
+    # NaN azimuths index bin 0 and propagate NaN via frac
+    idx = np.minimum(np.nan_to_num(az).astype(np.intp), 359)
+    frac = az - idx
+    return HORIZON_LUT[idx] + frac * (HORIZON_LUT[idx + 1] - HORIZON_LUT[idx])